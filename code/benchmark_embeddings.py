@@ -0,0 +1,98 @@
+import argparse
+import statistics
+import time
+
+from loader import load_all_text_files, load_yaml_config
+from logger import logger
+from onnx_embeddings import compare_embeddings, load_onnx_embeddings
+from vectordb_and_ingestion import APP_CONFIG_FPATH, ONNX_DIR, chunk_pages, get_embedding_model
+
+QUERIES = [
+    "What is transfer learning?",
+    "How does gradient boosting work?",
+    "Explain the bias-variance tradeoff.",
+    "What is a large language model?",
+    "How does a random forest reduce overfitting?",
+]
+
+
+def time_ingestion(embedding_model, pages_chunks: list[list[str]]) -> tuple[float, list]:
+    """Embed every page's chunks the way `insert_pages` does and time it."""
+    embeddings = []
+    start = time.perf_counter()
+    for chunks in pages_chunks:
+        embeddings.extend(embedding_model.embed_documents(chunks))
+    return time.perf_counter() - start, embeddings
+
+
+def time_queries(embedding_model, repeats: int) -> list[float]:
+    """Time single-query embedding calls, as done at retrieval time."""
+    # The first call pays for lazy initialization, keep it out of the numbers
+    embedding_model.embed_documents([QUERIES[0]])
+    latencies = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start = time.perf_counter()
+            embedding_model.embed_documents([query])
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PyTorch and ONNX embedding backends.")
+    parser.add_argument("--query-repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="Override intra_op_num_threads")
+    args = parser.parse_args()
+
+    embedding_params = load_yaml_config(APP_CONFIG_FPATH).get("embeddings", {})
+    onnx_params = embedding_params.get("onnx", {})
+    model_name = embedding_params.get("model_name", "sentence-transformers/all-MiniLM-L6-v2")
+    intra_op_num_threads = (
+        args.threads if args.threads is not None else onnx_params.get("intra_op_num_threads", 0)
+    )
+
+    backends = {"pytorch": get_embedding_model("pytorch")}
+    for name, quantize in (("onnx", False), ("onnx-int8", True)):
+        # A model outside the validation tolerance is reported, not fatal for the other backends
+        try:
+            backends[name] = load_onnx_embeddings(
+                model_name,
+                onnx_dir=ONNX_DIR,
+                quantize=quantize,
+                batch_size=embedding_params.get("batch_size", 32),
+                max_seq_length=onnx_params.get("max_seq_length", 256),
+                intra_op_num_threads=intra_op_num_threads,
+                tolerance=onnx_params.get("validation_tolerance", 1e-2),
+            )
+        except Exception as e:
+            logger.error(f"{name:<10} skipped: {e}")
+
+    pages_chunks = [chunk_pages(page) for page in load_all_text_files()]
+    n_chunks = sum(len(chunks) for chunks in pages_chunks)
+    logger.info(f"Benchmarking on {len(pages_chunks)} pages / {n_chunks} chunks")
+
+    reference_embeddings = None
+    baseline = {}
+    for name, embedding_model in backends.items():
+        try:
+            ingestion_time, embeddings = time_ingestion(embedding_model, pages_chunks)
+            query_latency = statistics.median(time_queries(embedding_model, args.query_repeats))
+        except Exception as e:
+            logger.error(f"{name:<10} failed: {e}")
+            continue
+        if reference_embeddings is None:
+            reference_embeddings = embeddings
+            baseline = {"ingestion": ingestion_time, "query": query_latency}
+        comparison = compare_embeddings(embeddings, reference_embeddings)
+
+        logger.info(
+            f"{name:<10} ingestion={ingestion_time:.2f}s "
+            f"({baseline['ingestion'] / ingestion_time:.2f}x) "
+            f"query_p50={query_latency * 1000:.2f}ms "
+            f"({baseline['query'] / query_latency:.2f}x) "
+            f"max_cosine_distance={comparison['max_cosine_distance']:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+
+from logger import logger
+from loader import load_yaml_config
+from server import APP_CONFIG_FPATH, PROMPT_CONFIG_FPATH, RAGServer
+
+# Sample questions, roughly matching the topics in the data folder
+QUERIES = [
+    "What is transfer learning?",
+    "How does gradient boosting work?",
+    "Explain the bias-variance tradeoff.",
+    "What is the difference between supervised and unsupervised learning?",
+    "How do convolutional neural networks process images?",
+    "What is a large language model?",
+    "How does a random forest reduce overfitting?",
+    "What is prompt engineering?",
+    "How does the k-nearest neighbors algorithm classify points?",
+    "What problem do recurrent neural networks solve?",
+]
+
+
+class StubLLM:
+    """
+    Stand-in for the Groq chat model so the benchmark measures the server,
+    not the remote LLM.
+
+    Args:
+        latency_ms (float): Simulated generation latency
+    """
+
+    def __init__(self, latency_ms: float = 50.0):
+        self.latency = latency_ms / 1000
+
+    async def ainvoke(self, prompt: str):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(content=f"Stub answer for a {len(prompt)} character prompt.")
+
+
+def serve(app_config: dict, prompt_config: dict, llm_latency_ms: float, port: int):
+    """Entry point of the server process."""
+    app = RAGServer(app_config, prompt_config, llm=StubLLM(llm_latency_ms))
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(
+    app_config: dict,
+    prompt_config: dict,
+    llm_latency_ms: float,
+    port: int,
+    timeout: float = 120.0,
+) -> multiprocessing.Process:
+    """
+    Run the server in its own process, so it doesn't share the GIL with the
+    load generator, and wait until /health reports it ready.
+
+    Raises:
+        RuntimeError: If the server process exits before it is ready.
+        TimeoutError: If the server is not warmed up within `timeout` seconds.
+    """
+    # Spawn rather than fork: the parent already holds an open Chroma client
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(app_config, prompt_config, llm_latency_ms, port), daemon=True
+    )
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if not process.is_alive():
+            raise RuntimeError(f"Server process exited during startup (exit code {process.exitcode})")
+        if time.monotonic() > deadline:
+            process.terminate()
+            process.join()
+            raise TimeoutError(f"Server was not ready after {timeout}s")
+        time.sleep(0.2)
+
+
+async def run_load(
+    base_url: str, endpoint: str, n_requests: int, concurrency: int
+) -> dict:
+    """
+    Fire `n_requests` POSTs at `endpoint` from `concurrency` workers.
+
+    Each worker sends its requests one after another over its own keep-alive
+    connection, like independent clients would. A single shared connection
+    pool serves bursts of responses unevenly and leaves some requests unsent
+    for seconds, which would be measured as server latency.
+
+    Returns:
+        dict: Throughput of successful requests and latency percentiles in milliseconds
+    """
+    remaining = iter(range(n_requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        limits = httpx.Limits(max_connections=1)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, json={"query": random.choice(QUERIES)})
+                except httpx.HTTPError as e:
+                    logger.warning(f"Request failed: {e!r}")
+                    errors += 1
+                    continue
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        raise RuntimeError(f"All {n_requests} requests failed")
+    latencies.sort()
+    return {
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server throughput with a stub LLM.")
+    parser.add_argument("--endpoint", default="/retrieve", choices=["/retrieve", "/answer"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=None)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    app_config = load_yaml_config(APP_CONFIG_FPATH)
+    prompt_config = load_yaml_config(PROMPT_CONFIG_FPATH)["rag_wiki_assistant_prompt"]
+
+    for batch_size in args.batch_sizes:
+        app_config["server"]["max_batch_size"] = batch_size
+        if args.max_wait_ms is not None:
+            app_config["server"]["max_wait_ms"] = args.max_wait_ms
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = start_server(
+            app_config, prompt_config, args.llm_latency_ms, args.port, timeout=args.ready_timeout
+        )
+        try:
+            stats = asyncio.run(run_load(base_url, args.endpoint, args.requests, args.concurrency))
+            health = httpx.get(f"{base_url}/health").json()
+        finally:
+            process.terminate()
+            process.join()
+
+        avg_batch = health["queries_served"] / max(health["batches_served"], 1)
+        logger.info(
+            f"{args.endpoint} max_batch_size={batch_size:<3} "
+            f"throughput={stats['throughput_rps']:.1f} req/s "
+            f"p50={stats['p50_ms']:.1f} ms p95={stats['p95_ms']:.1f} ms "
+            f"avg_batch={avg_batch:.1f} errors={stats['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
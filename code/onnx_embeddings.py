@@ -0,0 +1,325 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from langchain_huggingface import HuggingFaceEmbeddings
+from transformers import AutoModel, AutoTokenizer
+
+from logger import logger
+
+# Short texts used to check the ONNX model against the PyTorch model after export
+VALIDATION_TEXTS = [
+    "Transfer learning reuses a model trained on one task for another task.",
+    "Gradient boosting builds an ensemble of weak learners, typically decision trees.",
+    "What is the bias-variance tradeoff?",
+    "A recurrent neural network processes sequences by keeping a hidden state " * 20,
+]
+
+
+class OnnxEmbeddings:
+    """
+    Sentence-transformer embeddings computed with ONNX Runtime on CPU.
+
+    Mirrors the `embed_documents` / `embed_query` interface of `HuggingFaceEmbeddings`
+    and reproduces the sentence-transformers pipeline: mean pooling over the
+    attention mask followed by L2 normalization.
+
+    Args:
+        model_path (str): Path to the exported .onnx file
+        tokenizer_path (str): Directory holding the saved tokenizer
+        batch_size (int): Number of texts per inference call
+        max_seq_length (int): Texts are truncated to this many tokens
+        intra_op_num_threads (int): Threads used inside each operator; 0 lets ONNX Runtime decide
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        tokenizer_path: str,
+        batch_size: int = 32,
+        max_seq_length: int = 256,
+        intra_op_num_threads: int = 0,
+    ):
+        self.batch_size = batch_size
+        self.max_seq_length = max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = intra_op_num_threads
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            model_path, sess_options=session_options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        last_hidden_state = self.session.run(["last_hidden_state"], feeds)[0]
+
+        # Mean pooling over the real (non-padding) tokens
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a list of texts in batches.
+
+        Args:
+            texts (list[str]): Texts to embed
+
+        Returns:
+            list[list[float]]: One normalized embedding per text, in input order
+        """
+        if not texts:
+            return []
+        # Batch texts of similar length together to keep padding to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings: list[Optional[list[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch_indices = order[start:start + self.batch_size]
+            batch_embeddings = self._embed_batch([texts[i] for i in batch_indices])
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                embeddings[i] = embedding.tolist()
+        return embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query string."""
+        return self.embed_documents([text])[0]
+
+
+def export_onnx_model(model_name: str, output_dir: str) -> str:
+    """
+    Export the transformer part of a sentence-transformer to ONNX.
+
+    Args:
+        model_name (str): Hugging Face model name
+        output_dir (str): Directory for the .onnx file and the tokenizer
+
+    Returns:
+        str: Path to the exported model
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, "model.onnx")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["Sample text used to trace the model."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    logger.info(f"Exporting {model_name} to ONNX at {model_path}")
+    # Write to a temporary file first so an interrupted export never leaves a
+    # truncated model at the final path
+    tmp_path = f"{model_path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    os.replace(tmp_path, model_path)
+    return model_path
+
+
+def quantize_onnx_model(model_path: str, quantized_path: str) -> str:
+    """
+    Apply int8 dynamic quantization to the weights of an ONNX model.
+
+    Args:
+        model_path (str): Path to the float32 model
+        quantized_path (str): Where to write the quantized model
+
+    Returns:
+        str: Path to the quantized model
+    """
+    # Needs the separate `onnx` package, so only import it when quantizing
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info(f"Quantizing {model_path} to int8 at {quantized_path}")
+    # Same as the export: only a complete model is moved to the final path
+    tmp_path = f"{quantized_path}.tmp"
+    quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+def compare_embeddings(
+    candidate: list[list[float]], reference: list[list[float]]
+) -> dict:
+    """
+    Compare two sets of embeddings of the same texts.
+
+    Returns:
+        dict: "max_abs_diff" and "max_cosine_distance" over all pairs
+    """
+    candidate, reference = np.asarray(candidate), np.asarray(reference)
+    cosine_similarity = (candidate * reference).sum(axis=1) / (
+        np.linalg.norm(candidate, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+    return {
+        "max_abs_diff": float(np.abs(candidate - reference).max()),
+        "max_cosine_distance": float((1 - cosine_similarity).max()),
+    }
+
+
+def validate_onnx_embeddings(
+    onnx_embeddings: OnnxEmbeddings,
+    reference_embeddings: HuggingFaceEmbeddings,
+    tolerance: float,
+    texts: list[str] = VALIDATION_TEXTS,
+) -> dict:
+    """
+    Check that the ONNX model reproduces the PyTorch embeddings.
+
+    Args:
+        onnx_embeddings (OnnxEmbeddings): The model under test
+        reference_embeddings (HuggingFaceEmbeddings): The PyTorch model
+        tolerance (float): Max allowed cosine distance between the two embeddings of a text
+        texts (list[str]): Texts to compare on
+
+    Returns:
+        dict: The output of `compare_embeddings`
+
+    Raises:
+        ValueError: If any embedding deviates by more than the tolerance.
+    """
+    comparison = compare_embeddings(
+        onnx_embeddings.embed_documents(texts), reference_embeddings.embed_documents(texts)
+    )
+    logger.info(
+        f"ONNX validation: max abs diff {comparison['max_abs_diff']:.2e}, "
+        f"max cosine distance {comparison['max_cosine_distance']:.2e}"
+    )
+    if comparison["max_cosine_distance"] > tolerance:
+        raise ValueError(
+            f"ONNX embeddings deviate from PyTorch by a cosine distance of "
+            f"{comparison['max_cosine_distance']:.2e} (tolerance: {tolerance:.2e})"
+        )
+    return comparison
+
+
+def _validation_marker_path(model_path: str) -> str:
+    return f"{model_path}.validated.json"
+
+
+def _is_validated(model_path: str, tolerance: float) -> bool:
+    """Whether `model_path` passed validation within `tolerance` in an earlier run."""
+    marker_path = _validation_marker_path(model_path)
+    if not os.path.exists(marker_path):
+        return False
+    try:
+        with open(marker_path, "r", encoding="utf-8") as f:
+            marker = json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return False
+    return marker.get("max_cosine_distance", float("inf")) <= tolerance
+
+
+def load_onnx_embeddings(
+    model_name: str,
+    onnx_dir: str,
+    quantize: bool = False,
+    batch_size: int = 32,
+    max_seq_length: int = 256,
+    intra_op_num_threads: int = 0,
+    tolerance: float = 1e-2,
+) -> OnnxEmbeddings:
+    """
+    Load the ONNX embedding model, exporting (and quantizing) it on first use.
+
+    Every model on the way (the float32 export and, with `quantize`, the int8
+    model) is validated against the PyTorch model. A model that passes gets a
+    `.validated.json` marker next to it; a model without a marker, or whose
+    recorded deviation exceeds the tolerance, is validated again before use and
+    deleted if it fails.
+
+    Args:
+        model_name (str): Hugging Face model name
+        onnx_dir (str): Directory where exported models are cached
+        quantize (bool): Use the int8 dynamically quantized model
+        batch_size (int): Number of texts per inference call
+        max_seq_length (int): Texts are truncated to this many tokens
+        intra_op_num_threads (int): Threads used inside each operator; 0 lets ONNX Runtime decide
+        tolerance (float): Max allowed cosine distance to the PyTorch embeddings
+
+    Returns:
+        OnnxEmbeddings: The ready-to-use embedding model
+
+    Raises:
+        ValueError: If a model deviates from PyTorch by more than the tolerance.
+    """
+    output_dir = os.path.join(onnx_dir, model_name.replace("/", "__"))
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model_int8.onnx")
+    reference = None
+
+    def discard_model(model_path: str):
+        # Don't leave a bad model (or its marker) behind for the next run to pick up
+        for path in (model_path, _validation_marker_path(model_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def build_embeddings(model_path: str) -> OnnxEmbeddings:
+        try:
+            return OnnxEmbeddings(
+                model_path,
+                tokenizer_path=output_dir,
+                batch_size=batch_size,
+                max_seq_length=max_seq_length,
+                intra_op_num_threads=intra_op_num_threads,
+            )
+        except Exception:
+            # e.g. a corrupt file; remove it so the next run rebuilds it
+            logger.error(f"Could not load {model_path}, discarding it")
+            discard_model(model_path)
+            raise
+
+    def ensure_validated(model_path: str) -> Optional[OnnxEmbeddings]:
+        nonlocal reference
+        if _is_validated(model_path, tolerance):
+            return None
+        embeddings = build_embeddings(model_path)
+        if reference is None:
+            reference = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+        try:
+            comparison = validate_onnx_embeddings(embeddings, reference, tolerance)
+        except ValueError:
+            discard_model(model_path)
+            raise
+        with open(_validation_marker_path(model_path), "w", encoding="utf-8") as f:
+            json.dump({"tolerance": tolerance, **comparison}, f, indent=2)
+        return embeddings
+
+    # A rebuilt model has not been validated yet, whatever an old marker says
+    if not os.path.exists(fp32_path):
+        discard_model(fp32_path)
+        export_onnx_model(model_name, output_dir)
+    # The int8 model is derived from the float32 one, so that one is always checked too
+    embeddings = ensure_validated(fp32_path)
+    if quantize:
+        if not os.path.exists(int8_path):
+            discard_model(int8_path)
+            quantize_onnx_model(fp32_path, int8_path)
+        embeddings = ensure_validated(int8_path)
+
+    return embeddings or build_embeddings(int8_path if quantize else fp32_path)
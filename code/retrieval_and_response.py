@@ -1,5 +1,6 @@
 from logger import logger
 import os
+from typing import Union
 from vectordb_and_ingestion import get_db_collection, embed_documents
 from loader import load_yaml_config
 from langchain_groq import ChatGroq
@@ -13,11 +14,71 @@ load_dotenv()
 api_key = os.getenv("GROQ_API_KEY")
 
 collection = get_db_collection(collection_name="wiki_pages")
+
+
+def retrieve_relevant_documents_batch(
+    queries: list[str],
+    n_results: Union[int, list[int]] = 5,
+    threshold: Union[float, list[float]] = 0.3,
+) -> list[dict]:
+    """
+    Query the ChromaDB database with several queries at once.
+
+    All queries are embedded in a single forward pass and looked up with a
+    single multi-query vector search.
+
+    Args:
+        queries (list[str]): The search query strings
+        n_results (int | list[int]): Number of results to return, either shared or one per query (default: 5)
+        threshold (float | list[float]): Threshold for the cosine distance, either shared or one per query (default: 0.3)
+
+    Returns:
+        list[dict]: One result per query, each holding parallel "documents" and "distances" lists
+    """
+    if not queries:
+        return []
+    if isinstance(n_results, int):
+        n_results = [n_results] * len(queries)
+    if isinstance(threshold, (int, float)):
+        threshold = [threshold] * len(queries)
+    if len(n_results) != len(queries) or len(threshold) != len(queries):
+        raise ValueError("n_results and threshold must match the number of queries")
+
+    logger.info(f"Retrieving relevant documents for {len(queries)} queries")
+    # Embed the queries using the same model used for documents
+    logger.info("Embedding queries...")
+    query_embeddings = embed_documents(queries)
+
+    logger.info("Querying collection...")
+    # Query the collection once with the largest Top K; results come back sorted
+    # by distance, so each query is then cut down to its own Top K
+    results = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=max(n_results),
+        include=["documents", "distances"],
+    )
+
+    logger.info("Filtering results...")
+    batch_results = []
+    for i in range(len(queries)):
+        documents = results["documents"][i][: n_results[i]]
+        distances = results["distances"][i][: n_results[i]]
+        relevant_results = {"documents": [], "distances": []}
+        for document, distance in zip(documents, distances):
+            if distance < threshold[i]:
+                relevant_results["documents"].append(document)
+                relevant_results["distances"].append(distance)
+        # keeping two parallel lists
+        batch_results.append(relevant_results)
+
+    return batch_results
+
+
 def retrieve_relevant_documents(
     query: str,
     n_results: int = 5,
     threshold: float = 0.3,
-) -> list[str]:
+) -> dict:
     """
     Query the ChromaDB database with a string query.
 
@@ -27,45 +88,47 @@ def retrieve_relevant_documents(
         threshold (float): Threshold for the cosine similarity score (default: 0.3)
 
     Returns:
-        dict: Query results containing ids, documents, distances, and metadata
+        dict: Query results containing documents and distances
     """
     logger.info(f"Retrieving relevant documents for query: {query}")
-    relevant_results = {
-        "ids": [],
-        "documents": [],
-        "distances": [],
-    }
-    # Embed the query using the same model used for documents
-    logger.info("Embedding query...")
-    query_embedding = embed_documents([query])[0]  # Get the first (and only) embedding
+    return retrieve_relevant_documents_batch(
+        [query], n_results=n_results, threshold=threshold
+    )[0]
 
-    logger.info("Querying collection...")
-    # Query the collection
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        include=["documents", "distances"],
-    )
 
-    logger.info("Filtering results...")
-    keep_item = [False] * len(results["ids"][0])
-    for i, distance in enumerate(results["distances"][0]):
-        if distance < threshold:
-            keep_item[i] = True
+def build_rag_input(query: str, relevant_files: dict) -> str:
+    """
+    Build the content section of the RAG prompt from the retrieved documents.
 
-    relevant_results = {"ids": [], "documents": [], "distances": []}
+    Args:
+        query (str): The user's question
+        relevant_files (dict): Output of `retrieve_relevant_documents`
 
-    for i, keep in enumerate(keep_item):
-        if keep:
-            relevant_results["ids"].append(results["ids"][0][i])
-            relevant_results["documents"].append(results["documents"][0][i])
-            relevant_results["distances"].append(results["distances"][0][i])
+    Returns:
+        str: The input data to pass to the prompt builder
+    """
+    if not relevant_files['distances']:
+        return (
+            "No relevant documents found for this query.\n\n"
+            f"User's question:\n\n{query}"
+        )
+    # Otherwise, include the retrieved documents
+    return (
+        f"Relevant documents:\n\n{relevant_files['documents']}\n\n"
+        f"User's question:\n\n{query}"
+    )
+
+
+def get_llm() -> ChatGroq:
+    """
+    Create the chat model used to generate the final answers.
+    """
+    return ChatGroq(
+        model="llama-3.1-8b-instant",
+        temperature=0.7,
+        api_key=api_key
+    )
 
-    # keeping two parallel lists
-    return {
-        "documents": relevant_results["documents"],     # list of strings
-        "distances": relevant_results["distances"]      # list of floats
-    }
 
 def respond_to_query(
     prompt_config: dict,
@@ -80,29 +143,14 @@ def respond_to_query(
     relevant_files = retrieve_relevant_documents(
         query, n_results=n_results, threshold=threshold
     )
-    
-    if not relevant_files['distances']:
-        input_data = (
-            "No relevant documents found for this query.\n\n"
-            f"User's question:\n\n{query}"
-        )
-    else:
-        # Otherwise, include the retrieved documents
-        input_data = (
-            f"Relevant documents:\n\n{relevant_files['documents']}\n\n"
-            f"User's question:\n\n{query}"
-        )
+
+    input_data = build_rag_input(query, relevant_files)
 
     rag_assistant_prompt = build_prompt_from_config(
         prompt_config, input_data=input_data
     )
 
-
-    llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.7,
-    api_key=api_key
-    )
+    llm = get_llm()
 
     response = llm.invoke(rag_assistant_prompt)
     return response.content
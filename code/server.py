@@ -0,0 +1,413 @@
+import asyncio
+import json
+import math
+import os
+from typing import Any, Callable, Optional
+
+import uvicorn
+
+from logger import logger
+from loader import load_yaml_config
+from prompt import build_prompt_from_config
+from retrieval_and_response import (
+    build_rag_input,
+    get_llm,
+    retrieve_relevant_documents_batch,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # directory of this script
+APP_CONFIG_FPATH = os.path.join(BASE_DIR, "config", "config.yaml")
+PROMPT_CONFIG_FPATH = os.path.join(BASE_DIR, "config", "prompt_config.yaml")
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when a query cannot be served right now; answered with a 503."""
+
+
+class QueueFullError(ServiceUnavailableError):
+    """Raised when the micro-batcher has no room for another query."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent retrieval requests for a few milliseconds and serves
+    them with a single call to the batched retrieval function.
+
+    Args:
+        retrieve_fn: Callable taking (queries, n_results=[...], threshold=[...]) and
+            returning one result dict per query
+        max_batch_size (int): Max number of queries in one batch
+        max_wait_ms (float): How long the first query of a batch waits for others
+        max_queue_size (int): Max number of pending queries before rejecting new ones
+    """
+
+    def __init__(
+        self,
+        retrieve_fn: Callable[..., list[dict]] = retrieve_relevant_documents_batch,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 1024,
+    ):
+        self.retrieve_fn = retrieve_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.in_flight: list[tuple] = []
+        self.batches_served = 0
+        self.queries_served = 0
+
+    def start(self):
+        """Create the queue and start the background batching loop."""
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Cancel the batching loop and fail every query that is still pending."""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+        pending = self.in_flight
+        self.in_flight = []
+        while self.queue is not None and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        self.queue = None
+        for item in pending:
+            future = item[3]
+            if not future.done():
+                future.set_exception(ServiceUnavailableError("Server is shutting down"))
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def submit(
+        self, query: str, n_results: int, threshold: float, track: bool = True
+    ) -> dict:
+        """
+        Queue a query and wait for its share of the next batch.
+
+        Args:
+            track (bool): Count the query in `batches_served` / `queries_served`
+
+        Raises:
+            ServiceUnavailableError: If the batcher is not running.
+            QueueFullError: If the queue already holds `max_queue_size` queries.
+        """
+        if self.queue is None:
+            raise ServiceUnavailableError("Server is not accepting queries")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((query, n_results, threshold, future, track))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Queue is full ({self.max_queue_size} pending queries)")
+        return await future
+
+    async def _collect_batch(self) -> list[tuple]:
+        # Block until the first query arrives, then give others a short window to join.
+        # Items go into `in_flight` as soon as they leave the queue, so `stop()`
+        # can fail them even when it cancels the worker inside the wait window
+        self.in_flight = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(self.in_flight) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                self.in_flight.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return self.in_flight
+
+    async def _retrieve(self, batch: list[tuple]) -> list[dict]:
+        """
+        Run the blocking retrieval function for `batch` off the event loop.
+
+        Raises:
+            RuntimeError: If it does not return exactly one result per query.
+        """
+        queries, n_results, thresholds, _, _ = map(list, zip(*batch))
+        results = await asyncio.to_thread(
+            self.retrieve_fn, queries, n_results=n_results, threshold=thresholds
+        )
+        if len(results) != len(batch):
+            raise RuntimeError(
+                f"Retrieval returned {len(results)} results for {len(batch)} queries"
+            )
+        return results
+
+    async def _retrieve_one(self, item: tuple):
+        query, _, _, future, _ = item
+        try:
+            result = (await self._retrieve([item]))[0]
+        except Exception as e:
+            logger.exception(f"Retrieval failed for query: {query}")
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            futures = [item[3] for item in batch]
+            tracked = [item[4] for item in batch]
+            try:
+                # The forward pass and vector search are blocking, so run them off the event loop
+                results = await self._retrieve(batch)
+            except Exception:
+                logger.exception("Batched retrieval failed, retrying the queries one by one")
+                # Only the query that actually breaks retrieval should fail
+                for item in batch:
+                    await self._retrieve_one(item)
+            else:
+                for future, result in zip(futures, results):
+                    # The client may have disconnected while the batch was running
+                    if not future.done():
+                        future.set_result(result)
+            self.in_flight = []
+
+            if any(tracked):
+                self.batches_served += 1
+                self.queries_served += sum(tracked)
+
+
+class RAGServer:
+    """
+    Minimal ASGI application exposing the RAG pipeline over HTTP.
+
+    Endpoints:
+        GET  /health   - 200 once the embedding model is warm, 503 while warming up
+        POST /retrieve - {"query", "n_results"?, "threshold"?} -> relevant documents
+        POST /answer   - same body -> LLM answer and the documents it was based on
+
+    Args:
+        app_config (dict): Parsed `config.yaml`
+        prompt_config (dict): The `rag_wiki_assistant_prompt` section of `prompt_config.yaml`
+        llm: Chat model exposing `ainvoke`; defaults to `get_llm()`, created on the first /answer
+        retrieve_fn: Batched retrieval function; defaults to `retrieve_relevant_documents_batch`
+    """
+
+    def __init__(
+        self,
+        app_config: dict,
+        prompt_config: dict,
+        llm: Any = None,
+        retrieve_fn: Callable[..., list[dict]] = retrieve_relevant_documents_batch,
+    ):
+        server_params = app_config.get("server", {})
+        vectordb_params = app_config.get("vectordb", {})
+        self.prompt_config = prompt_config
+        self.llm = llm
+        self.default_n_results = vectordb_params.get("n_results", 5)
+        self.default_threshold = vectordb_params.get("threshold", 0.5)
+        self.max_n_results = server_params.get("max_n_results", 50)
+        self.warmup_on_startup = server_params.get("warmup_on_startup", True)
+        self.warmup_max_backoff = server_params.get("warmup_max_backoff_s", 30)
+        self.ready = False
+
+        # Each batch must fit in a single forward pass of the embedding model
+        max_batch_size = server_params.get("max_batch_size", 8)
+        embedding_batch_size = app_config.get("embeddings", {}).get("batch_size", 32)
+        if max_batch_size > embedding_batch_size:
+            raise ValueError(
+                f"server.max_batch_size ({max_batch_size}) must not exceed "
+                f"embeddings.batch_size ({embedding_batch_size})"
+            )
+        self.batcher = MicroBatcher(
+            retrieve_fn=retrieve_fn,
+            max_batch_size=max_batch_size,
+            max_wait_ms=server_params.get("max_wait_ms", 5),
+            max_queue_size=server_params.get("max_queue_size", 1024),
+        )
+        self.warmup_task: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.batcher.start()
+                if self.warmup_on_startup:
+                    self.warmup_task = asyncio.create_task(self.warm_up())
+                else:
+                    self.ready = True
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.warmup_task is not None:
+                    self.warmup_task.cancel()
+                await self.batcher.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def warm_up(self):
+        """
+        Push one query through the batcher so the model and index are loaded.
+
+        Failures are retried with an exponential backoff until warm-up succeeds.
+        """
+        backoff = 1
+        while True:
+            logger.info("Warming up the embedding model...")
+            try:
+                await self.batcher.submit(
+                    "warm-up", self.default_n_results, self.default_threshold, track=False
+                )
+            except Exception:
+                logger.exception(f"Warm-up failed, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.warmup_max_backoff)
+                continue
+            self.ready = True
+            logger.info("Warm-up complete, server is ready")
+            return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        routes = {
+            "/health": ("GET", self._health),
+            "/retrieve": ("POST", self._retrieve),
+            "/answer": ("POST", self._answer),
+        }
+        if path not in routes:
+            await send_json(send, 404, {"error": f"Not found: {path}"})
+            return
+        allowed_method, handler = routes[path]
+        if method != allowed_method:
+            await send_json(send, 405, {"error": f"Method {method} not allowed on {path}"})
+            return
+
+        body = await read_body(receive)
+        try:
+            status, payload = await handler(body)
+        except ServiceUnavailableError as e:
+            status, payload = 503, {"error": str(e)}
+        except Exception as e:
+            logger.exception(f"Error while handling {path}")
+            status, payload = 500, {"error": str(e)}
+        await send_json(send, status, payload)
+
+    def _parse_request(self, body: bytes) -> tuple[str, int, float]:
+        """
+        Parse and validate a /retrieve or /answer request body.
+
+        Raises:
+            ValueError: If the body is not valid JSON or a field has the wrong type.
+        """
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON body: {e}") from e
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object")
+
+        query = data.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Missing required field: 'query'")
+        n_results = data.get("n_results", self.default_n_results)
+        if not isinstance(n_results, int) or isinstance(n_results, bool) or n_results < 1:
+            raise ValueError("'n_results' must be a positive integer")
+        if n_results > self.max_n_results:
+            raise ValueError(f"'n_results' must not exceed {self.max_n_results}")
+        threshold = data.get("threshold", self.default_threshold)
+        if not isinstance(threshold, (int, float)) or isinstance(threshold, bool):
+            raise ValueError("'threshold' must be a number")
+        # json.loads accepts NaN and Infinity, which make the distance filter meaningless
+        if not math.isfinite(threshold):
+            raise ValueError("'threshold' must be a finite number")
+        return query, n_results, float(threshold)
+
+    async def _health(self, body: bytes) -> tuple[int, dict]:
+        payload = {
+            "status": "ok" if self.ready else "warming_up",
+            "queue_depth": self.batcher.queue_depth,
+            "batches_served": self.batcher.batches_served,
+            "queries_served": self.batcher.queries_served,
+        }
+        return (200 if self.ready else 503), payload
+
+    async def _retrieve(self, body: bytes) -> tuple[int, dict]:
+        try:
+            query, n_results, threshold = self._parse_request(body)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        relevant_files = await self.batcher.submit(query, n_results, threshold)
+        return 200, relevant_files
+
+    async def _answer(self, body: bytes) -> tuple[int, dict]:
+        try:
+            query, n_results, threshold = self._parse_request(body)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        relevant_files = await self.batcher.submit(query, n_results, threshold)
+
+        input_data = build_rag_input(query, relevant_files)
+        rag_assistant_prompt = build_prompt_from_config(
+            self.prompt_config, input_data=input_data
+        )
+        # Created lazily so /retrieve keeps working without LLM credentials
+        if self.llm is None:
+            self.llm = get_llm()
+        response = await self.llm.ainvoke(rag_assistant_prompt)
+        return 200, {"answer": response.content, **relevant_files}
+
+
+async def read_body(receive) -> bytes:
+    """Read the full HTTP request body from an ASGI receive channel."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_json(send, status: int, payload: dict):
+    """Send a JSON response over an ASGI send channel."""
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_app(llm: Any = None) -> RAGServer:
+    """Build the ASGI app from the config files in `code/config`."""
+    app_config = load_yaml_config(APP_CONFIG_FPATH)
+    prompt_config = load_yaml_config(PROMPT_CONFIG_FPATH)
+    return RAGServer(
+        app_config=app_config,
+        prompt_config=prompt_config["rag_wiki_assistant_prompt"],
+        llm=llm,
+    )
+
+
+if __name__ == "__main__":
+    app_config = load_yaml_config(APP_CONFIG_FPATH)
+    server_params = app_config.get("server", {})
+
+    # A single worker: batching only helps when requests share one process
+    uvicorn.run(
+        create_app(),
+        host=server_params.get("host", "0.0.0.0"),
+        port=server_params.get("port", 8000),
+    )
@@ -1,15 +1,22 @@
 import os
+from functools import lru_cache
 import chromadb
 import torch
 import shutil
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from loader import load_all_text_files
+from typing import TYPE_CHECKING, Optional, Union
+from loader import load_all_text_files, load_yaml_config
 from logger import logger
 
+if TYPE_CHECKING:
+    from onnx_embeddings import OnnxEmbeddings
+
 # Setting up the directory paths for important folders
 OUTPUTS_DIR = os.path.join(os.getcwd(), "outputs")
 VECTORDB_DIR = os.path.join(OUTPUTS_DIR, "vector_db")
+ONNX_DIR = os.path.join(OUTPUTS_DIR, "onnx")
+APP_CONFIG_FPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "config.yaml")
 
 
 # Select the device: CUDA (GPU) if available, otherwise Apple MPS (Mac GPU), otherwise fall back on CPU
@@ -98,6 +105,51 @@ def chunk_pages(
     return text_splitter.split_text(pages)
 
 
+@lru_cache(maxsize=None)
+def get_embedding_model(
+    backend: Optional[str] = None,
+) -> Union[HuggingFaceEmbeddings, "OnnxEmbeddings"]:
+    """
+    Load the embedding model once and reuse it for every subsequent call.
+
+    Args:
+        backend (str): "pytorch" or "onnx". Defaults to `embeddings.backend` in config.yaml
+
+    Returns:
+        HuggingFaceEmbeddings | OnnxEmbeddings: The model used for documents and queries
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    embedding_params = load_yaml_config(APP_CONFIG_FPATH).get("embeddings", {})
+    backend = backend or embedding_params.get("backend", "pytorch")
+    model_name = embedding_params.get("model_name", "sentence-transformers/all-MiniLM-L6-v2")
+    batch_size = embedding_params.get("batch_size", 32)
+
+    # This model converts text into numerical vectors (embeddings) suitable for semantic search
+    if backend == "pytorch":
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"batch_size": batch_size},
+        )
+    if backend == "onnx":
+        # Imported here so the PyTorch backend never loads onnxruntime
+        from onnx_embeddings import load_onnx_embeddings
+
+        onnx_params = embedding_params.get("onnx", {})
+        return load_onnx_embeddings(
+            model_name,
+            onnx_dir=ONNX_DIR,
+            quantize=onnx_params.get("quantize", False),
+            batch_size=batch_size,
+            max_seq_length=onnx_params.get("max_seq_length", 256),
+            intra_op_num_threads=onnx_params.get("intra_op_num_threads", 0),
+            tolerance=onnx_params.get("validation_tolerance", 1e-2),
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
 def embed_documents(documents: list[str]) -> list[list[float]]:
     """
     Converts a list of text chunks into embeddings (vectors) using the pre-loaded model.
@@ -111,13 +163,8 @@ def embed_documents(documents: list[str]) -> list[list[float]]:
     # Guard clause: if the input is empty, return an empty list
     if not documents:
         return []
-    # Initialize the embedding model
-    # This model converts text into numerical vectors (embeddings) suitable for semantic search
-
-    embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",
-    model_kwargs={"device": "cpu"}
-    )
+    # Get the (cached) embedding model
+    embedding_model = get_embedding_model()
     # Use the initialized embedding model to compute embeddings
     # Each text chunk becomes a numerical vector that can be stored in a vector database
     embeddings = embedding_model.embed_documents(documents)